@@ -1,7 +1,6 @@
 import os
 import json
 import whisper
-import requests
 import sounddevice as sd
 import numpy as np
 import tempfile
@@ -13,7 +12,10 @@ import serial
 import threading
 import subprocess
 import logging
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
+
+from llm_router import LLMRouter
+from piper_voice import PiperVoice
 
 # ======================================
 # LOGGING CONFIGURATION
@@ -30,6 +32,9 @@ logging.basicConfig(
 
 logger = logging.getLogger("assistant")
 
+# urllib3 logs every connection at DEBUG; the LLM health polls would flood assistant.log.
+logging.getLogger("urllib3").setLevel(logging.WARNING)
+
 
 # ======================================
 # HIGH-LEVEL FEATURE TOGGLES
@@ -46,7 +51,17 @@ USE_GUI_MODE = False
 # Language selection:
 # "es" -> Spanish interaction (prompts in Spanish, Piper Spanish model, Whisper language "es")
 # "en" -> English interaction (prompts in English, Piper English model, Whisper language "en")
-LANGUAGE = "es"  # change to "en" for English
+# "auto" -> per-utterance detection (Whisper language ID), both Piper voices kept loaded
+LANGUAGE = "es"  # change to "en" for English or "auto" for bilingual classrooms
+
+# Languages the assistant can answer in (prompts + Piper voices exist for these)
+SUPPORTED_LANGUAGES = ("es", "en")
+
+# Used in "auto" mode before the first detection and when detection fails
+AUTO_DEFAULT_LANGUAGE = "es"
+
+# Seconds of captured audio used for Whisper language ID in "auto" mode
+LANGID_SECONDS = 5.0
 
 
 # ======================================
@@ -64,21 +79,30 @@ else:
     logger.info(f"[CONFIG] Headless mode enabled: using Whisper '{WHISPER_MODEL_NAME}' on {WHISPER_DEVICE}.")
 
 # Whisper language based on interaction language
-if LANGUAGE == "es":
-    WHISPER_LANGUAGE = "es"
+if LANGUAGE == "auto":
+    DEFAULT_LANGUAGE = AUTO_DEFAULT_LANGUAGE
+    ACTIVE_LANGUAGES = SUPPORTED_LANGUAGES
+    logger.info(
+        f"[CONFIG] Interaction language: automatic (Whisper language ID on the first "
+        f"{LANGID_SECONDS:.0f}s, default '{DEFAULT_LANGUAGE}')."
+    )
+elif LANGUAGE == "es":
+    DEFAULT_LANGUAGE = "es"
+    ACTIVE_LANGUAGES = ("es",)
     logger.info("[CONFIG] Interaction language: Spanish (Whisper language 'es').")
 else:
-    WHISPER_LANGUAGE = "en"
+    DEFAULT_LANGUAGE = "en"
+    ACTIVE_LANGUAGES = ("en",)
     logger.info("[CONFIG] Interaction language: English (Whisper language 'en').")
 
-# Piper model path based on interaction language
-if LANGUAGE == "es":
+# Piper model path per interaction language
+PIPER_MODEL_PATHS = {
     # You can switch to es_MX-claude-medium.onnx if you prefer that voice
-    PIPER_MODEL_PATH = "/usr/local/share/piper/models/es_MX-ald-medium.onnx"
-    logger.info(f"[CONFIG] Piper Spanish model: {PIPER_MODEL_PATH}")
-else:
-    PIPER_MODEL_PATH = "/usr/local/share/piper/models/en_US-lessac-medium.onnx"
-    logger.info(f"[CONFIG] Piper English model: {PIPER_MODEL_PATH}")
+    "es": "/usr/local/share/piper/models/es_MX-ald-medium.onnx",
+    "en": "/usr/local/share/piper/models/en_US-lessac-medium.onnx",
+}
+for _lang in ACTIVE_LANGUAGES:
+    logger.info(f"[CONFIG] Piper '{_lang}' model: {PIPER_MODEL_PATHS[_lang]}")
 
 
 # ======================================
@@ -88,11 +112,27 @@ else:
 EMOTION_NEUTRAL = "NEUTRAL"
 EMOTION_FRUSTRATED = "FRUSTRATED"
 
-LLM_URL = "http://127.0.0.1:8080/completion"
+# Local llama.cpp servers (base URLs). Requests go to the least-loaded
+# healthy endpoint and fail over to the next one if it errors out.
+# Example: a fast small model on 8080 and a larger one on 8081.
+LLM_ENDPOINTS = [
+    "http://127.0.0.1:8080",
+    # "http://127.0.0.1:8081",
+]
+LLM_COMPLETION_PATH = "/completion"
+
+LLM_HEALTH_POLL_INTERVAL = 2.0   # seconds between /health + /slots polls
+LLM_HEALTH_TIMEOUT = 1.0         # timeout for each poll request
+LLM_CONNECT_TIMEOUT = 2.0        # connect timeout per completion attempt
+LLM_ATTEMPT_TIMEOUT = 25.0       # read timeout per attempt, so a hung server leaves time to fail over
+LLM_REQUEST_DEADLINE = 60.0      # total budget for one completion, failovers included
+LLM_FAILURE_COOLDOWN = 60.0      # seconds a failed/timed-out endpoint stays demoted
+LLM_ROUTER_MAX_DECISIONS = 50    # routing decisions kept in the stats export
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 BEEP_SOUND = os.path.join(BASE_DIR, "assets/bip.wav")
 BEEP2_SOUND = os.path.join(BASE_DIR, "assets/bip2.wav")
+LLM_ROUTER_STATS_FILE = os.path.join(BASE_DIR, "llm_router_stats.json")
 
 BUTTON_PIN = 15
 
@@ -102,6 +142,14 @@ SERIAL_BAUDRATE = 115200
 
 PIPER_BIN = "/home/orin/piper/build/piper"
 PIPER_OUTPUT_FILE = "response.wav"
+PIPER_SYNTH_TIMEOUT = 30.0  # seconds before a silent resident Piper process is killed
+
+# Fixed line per voice, synthesized at start-up to measure steady-state
+# synthesis time per character (used to report language-switch cost)
+PIPER_CALIBRATION_TEXTS = {
+    "es": "Hola, soy tu asistente educativo. ¿En qué te puedo ayudar hoy?",
+    "en": "Hello, I am your educational assistant. How can I help you today?",
+}
 
 
 # ======================================
@@ -193,13 +241,65 @@ class EmotionManager:
         )
 
 
+# ======================================
+# LLM ROUTER INITIALIZATION
+# ======================================
+
+llm_router = LLMRouter(
+    LLM_ENDPOINTS,
+    completion_path=LLM_COMPLETION_PATH,
+    health_timeout=LLM_HEALTH_TIMEOUT,
+    connect_timeout=LLM_CONNECT_TIMEOUT,
+    attempt_timeout=LLM_ATTEMPT_TIMEOUT,
+    deadline=LLM_REQUEST_DEADLINE,
+    failure_cooldown=LLM_FAILURE_COOLDOWN,
+    stats_file=LLM_ROUTER_STATS_FILE,
+    max_decisions=LLM_ROUTER_MAX_DECISIONS,
+)
+
+
 # ======================================
 # WHISPER MODEL INITIALIZATION
 # ======================================
 
 logger.info(f"[INIT] Loading Whisper '{WHISPER_MODEL_NAME}' on {WHISPER_DEVICE}...")
+_whisper_load_start = time.monotonic()
 whisper_model = whisper.load_model(WHISPER_MODEL_NAME, device=WHISPER_DEVICE)
-logger.info("[INIT] Whisper model loaded.")
+WHISPER_LOAD_SECONDS = time.monotonic() - _whisper_load_start
+
+
+def process_uptime_seconds() -> Optional[float]:
+    """
+    Seconds since this process was started (interpreter start-up included),
+    from /proc on Linux. Returns None if /proc is unavailable.
+    """
+    try:
+        with open("/proc/self/stat", encoding="utf-8") as stat_file:
+            # Fields after the ')' closing the command name start at field 3;
+            # starttime (clock ticks after boot) is field 22.
+            start_ticks = int(stat_file.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", encoding="utf-8") as uptime_file:
+            uptime = float(uptime_file.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return None
+
+
+# Process start-up + imports + Whisper load: the part of a restart that
+# doesn't depend on the voice
+_uptime = process_uptime_seconds()
+if _uptime is not None:
+    WHISPER_READY_SECONDS = _uptime
+    logger.info(
+        f"[INIT] Whisper model loaded in {WHISPER_LOAD_SECONDS:.2f}s "
+        f"({WHISPER_READY_SECONDS:.2f}s since process start)."
+    )
+else:
+    WHISPER_READY_SECONDS = WHISPER_LOAD_SECONDS
+    logger.info(
+        f"[INIT] Whisper model loaded in {WHISPER_LOAD_SECONDS:.2f}s "
+        "(process start time unavailable; restart baseline excludes start-up and imports)."
+    )
 
 
 # ======================================
@@ -315,12 +415,14 @@ def emotion_serial_worker(
 # PROMPT BUILDING (EMOTION-AWARE, MULTI-LANGUAGE)
 # ======================================
 
-def build_system_prompt(emotion_state: str) -> str:
+def build_system_prompt(emotion_state: str, language: Optional[str] = None) -> str:
     """
     Build the system prompt depending on the current emotion state
-    and selected LANGUAGE ("es" or "en").
+    and interaction language ("es" or "en", DEFAULT_LANGUAGE if None).
     """
-    if LANGUAGE == "es":
+    language = language or DEFAULT_LANGUAGE
+
+    if language == "es":
         base = (
             "Eres un asistente educativo en español. Responde con un máximo de 150 tokens. "
             "No uses listas ni símbolos como *, •, >>. "
@@ -344,7 +446,7 @@ def build_system_prompt(emotion_state: str) -> str:
 
         return base + extra
 
-    else:  # LANGUAGE == "en"
+    else:  # language == "en"
         base = (
             "You are an educational assistant. Answer in English with a maximum of 150 tokens. "
             "Do not use lists or symbols like *, •, >>. "
@@ -416,15 +518,43 @@ def record_audio_while_pressed(filename: str, fs: int = 16000) -> None:
         logger.error(f"Error saving audio to {filename}: {exc}")
 
 
-def transcribe_audio(filename: str) -> str:
+def detect_language(filename: str) -> Tuple[str, float]:
+    """
+    Run Whisper language ID on the first LANGID_SECONDS of the recorded
+    audio, restricted to SUPPORTED_LANGUAGES.
+    Returns (language, elapsed_seconds); DEFAULT_LANGUAGE on error.
+    """
+    start = time.monotonic()
+    try:
+        audio = whisper.load_audio(filename)
+        audio = audio[: int(LANGID_SECONDS * whisper.audio.SAMPLE_RATE)]
+        audio = whisper.pad_or_trim(audio)
+        mel = whisper.log_mel_spectrogram(audio, n_mels=whisper_model.dims.n_mels)
+        _, probs = whisper_model.detect_language(mel.to(whisper_model.device))
+    except Exception as exc:
+        elapsed = time.monotonic() - start
+        logger.error(f"[LANGID] Error during language detection: {exc}")
+        return DEFAULT_LANGUAGE, elapsed
+
+    candidates = {lang: float(probs.get(lang, 0.0)) for lang in SUPPORTED_LANGUAGES}
+    language = max(candidates, key=candidates.get)
+    elapsed = time.monotonic() - start
+
+    probs_str = ", ".join(f"{lang}={prob:.2f}" for lang, prob in candidates.items())
+    logger.info(f"[LANGID] Detected '{language}' in {elapsed * 1000:.0f} ms ({probs_str})")
+    return language, elapsed
+
+
+def transcribe_audio(filename: str, language: Optional[str] = None) -> str:
     """
     Run Whisper transcription on the recorded audio file.
     """
-    logger.info(f"Starting transcription for file: {filename}")
+    language = language or DEFAULT_LANGUAGE
+    logger.info(f"Starting transcription for file: {filename} (language '{language}')")
     try:
         result = whisper_model.transcribe(
             filename,
-            language=WHISPER_LANGUAGE,
+            language=language,
             task="transcribe",
             fp16=False,
             temperature=0.0,
@@ -445,8 +575,8 @@ def transcribe_audio(filename: str) -> str:
 
 def call_llm_with_prompt(prompt: str) -> Optional[str]:
     """
-    Perform a single call to the local LLM server and return raw text
-    extracted from the JSON response, or None on error.
+    Perform a single call to the local LLM servers (through llm_router)
+    and return raw text extracted from the JSON response, or None on error.
     """
     logger.debug("================= PROMPT SENT TO LLM =================")
     logger.debug(prompt)
@@ -462,12 +592,11 @@ def call_llm_with_prompt(prompt: str) -> Optional[str]:
     }
 
     try:
-        response = requests.post(
-            LLM_URL,
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=60,
-        )
+        response = llm_router.post_completion(payload)
+
+        if response is None:
+            logger.error("No LLM endpoint could serve the request.")
+            return None
 
         logger.debug("=========== RAW RESPONSE (response.text) ===========")
         logger.debug(response.text)
@@ -513,18 +642,20 @@ def ask_llm_with_emotion(
     user_query: str,
     emotion_state: str,
     allow_fallback: bool = True,
+    language: Optional[str] = None,
 ) -> str:
     """
     High-level function to ask the LLM with:
     - cleaned user text
-    - emotion-aware system prompt
+    - emotion-aware system prompt in the given language
     - optional fallback on empty response
     - cleaned output for TTS
     """
+    language = language or DEFAULT_LANGUAGE
     cleaned_query = clean_text_for_llm(user_query)
-    system_prompt = build_system_prompt(emotion_state)
+    system_prompt = build_system_prompt(emotion_state, language)
 
-    if LANGUAGE == "es":
+    if language == "es":
         full_prompt = (
             f"{system_prompt}\n"
             f"Pregunta del alumno:\n{cleaned_query}\n\n"
@@ -543,7 +674,7 @@ def ask_llm_with_emotion(
 
     if text is None:
         logger.error("LLM returned None (connection or internal error).")
-        if LANGUAGE == "es":
+        if language == "es":
             return "Hubo un error al conectar con el modelo local."
         else:
             return "There was an error connecting to the local model."
@@ -553,7 +684,7 @@ def ask_llm_with_emotion(
 
         if allow_fallback:
             logger.info("Trying fallback with minimal prompt...")
-            if LANGUAGE == "es":
+            if language == "es":
                 fallback_prompt = (
                     "Responde en español de forma breve y clara a la siguiente pregunta de un alumno. "
                     f"{cleaned_query}\n"
@@ -569,7 +700,7 @@ def ask_llm_with_emotion(
             if fallback_text and fallback_text.strip():
                 return clean_llm_response(fallback_text)
 
-        if LANGUAGE == "es":
+        if language == "es":
             return "Lo siento, no pude generar una respuesta."
         else:
             return "Sorry, I was not able to generate a response."
@@ -581,29 +712,132 @@ def ask_llm_with_emotion(
 # TEXT-TO-SPEECH
 # ======================================
 
-def text_to_speech(text: str) -> None:
+# Resident voices per language, filled by load_piper_voices()
+piper_voices: Dict[str, PiperVoice] = {}
+
+
+def load_piper_voices() -> Dict[str, float]:
     """
-    Convert text to speech using Piper.
+    Load one resident Piper voice per language in ACTIVE_LANGUAGES.
+    Only voices whose warm-up succeeds are registered in piper_voices;
+    the others fall back to one-shot Piper in text_to_speech().
+    Returns the load time in seconds per registered language.
     """
+    load_seconds = {}
+    for language in ACTIVE_LANGUAGES:
+        voice = PiperVoice(
+            language,
+            PIPER_MODEL_PATHS[language],
+            PIPER_BIN,
+            synth_timeout=PIPER_SYNTH_TIMEOUT,
+        )
+        elapsed = voice.load(PIPER_CALIBRATION_TEXTS[language])
+        if elapsed is None:
+            logger.error(f"[INIT] Piper voice '{language}' failed to load; using one-shot Piper.")
+            voice.close()
+            continue
+        piper_voices[language] = voice
+        load_seconds[language] = elapsed
+        logger.info(
+            f"[INIT] Piper voice '{language}' resident (loaded in {elapsed:.2f}s, "
+            f"steady-state {voice.seconds_per_char() * 1000:.1f} ms/char)."
+        )
+    return load_seconds
+
+
+def close_piper_voices() -> None:
+    """Stop every resident Piper voice."""
+    for voice in piper_voices.values():
+        voice.close()
+    piper_voices.clear()
+
+
+def text_to_speech(text: str, language: Optional[str] = None) -> float:
+    """
+    Convert text to speech using the resident Piper voice for the language,
+    falling back to a one-shot Piper run if that voice is unavailable.
+    Returns the synthesis time in seconds (playback excluded).
+    """
+    language = language or DEFAULT_LANGUAGE
+
+    voice = piper_voices.get(language)
+    if voice is not None:
+        start = time.monotonic()
+        wav_path = voice.synthesize(text)
+        synth_seconds = time.monotonic() - start
+        if wav_path:
+            try:
+                subprocess.run(["aplay", wav_path], check=False)
+                logger.info("TTS playback completed.")
+            except Exception as exc:
+                logger.error(f"[TTS] Error playing {wav_path}: {exc}")
+            finally:
+                try:
+                    os.remove(wav_path)
+                except OSError:
+                    pass
+            return synth_seconds
+        logger.warning(f"[TTS] Falling back to one-shot Piper for '{language}'.")
+
     safe_text = text.replace('"', '\\"')
     echo_cmd = f'echo "{safe_text}"'
 
     piper_cmd = [
         PIPER_BIN,
         "--model",
-        PIPER_MODEL_PATH,
+        PIPER_MODEL_PATHS[language],
         "--length_scale",
         "0.9",
         "--output_file",
         PIPER_OUTPUT_FILE,
     ]
 
+    start = time.monotonic()
+    synth_seconds = 0.0
     try:
         subprocess.run(f"{echo_cmd} | " + " ".join(piper_cmd), shell=True, check=False)
+        synth_seconds = time.monotonic() - start
         subprocess.run(["aplay", PIPER_OUTPUT_FILE], check=False)
         logger.info("TTS playback completed.")
     except Exception as exc:
         logger.error(f"[TTS] Error running Piper: {exc}")
+    return synth_seconds
+
+
+# ======================================
+# LANGUAGE SWITCH METRICS
+# ======================================
+
+def log_switch_cost(
+    from_language: str,
+    to_language: str,
+    text: str,
+    synth_seconds: float,
+    expected_per_char: Optional[float],
+    restart_seconds: Optional[float],
+) -> None:
+    """
+    Log what a language switch cost: the first synthesis on the newly
+    selected voice against that voice's steady-state time for the same
+    number of characters. Since both voices stay resident the extra cost
+    should be about 0; it is reported next to the restart baseline.
+    """
+    restart_str = f"{restart_seconds:.2f}s" if restart_seconds is not None else "n/a"
+
+    if expected_per_char is None:
+        logger.info(
+            f"[LANG] Switched '{from_language}' -> '{to_language}': no resident voice "
+            f"(one-shot Piper {synth_seconds:.2f}s); restart baseline {restart_str}."
+        )
+        return
+
+    chars = len(" ".join(text.split()))
+    expected = expected_per_char * chars
+    logger.info(
+        f"[LANG] Switched '{from_language}' -> '{to_language}': first synthesis "
+        f"{synth_seconds:.2f}s vs {expected:.2f}s steady-state for {chars} chars "
+        f"(switch cost {synth_seconds - expected:+.2f}s) vs restart baseline {restart_str}."
+    )
 
 
 # ======================================
@@ -641,6 +875,35 @@ def main() -> None:
     else:
         logger.info("Image-based emotion is DISABLED by configuration.")
 
+    # LLM endpoint health checks
+    threading.Thread(
+        target=llm_router.health_worker,
+        kwargs={"interval": LLM_HEALTH_POLL_INTERVAL},
+        daemon=True,
+        name="LLMHealthThread",
+    ).start()
+
+    # Resident Piper voices (both in "auto" mode, so switching needs no reload)
+    piper_load_seconds = load_piper_voices()
+
+    # Restarting to change language = process start-up (imports + Whisper)
+    # plus loading that language's voice only.
+    restart_seconds = {
+        language: WHISPER_READY_SECONDS + seconds
+        for language, seconds in piper_load_seconds.items()
+    }
+    for language, seconds in restart_seconds.items():
+        logger.info(
+            f"[INIT] Restart baseline for '{language}': {seconds:.2f}s "
+            f"(start-up + Whisper {WHISPER_READY_SECONDS:.2f}s + Piper {piper_load_seconds[language]:.2f}s)."
+        )
+
+    current_language = DEFAULT_LANGUAGE
+    langid_turns = 0
+    langid_total_seconds = 0.0
+    # Language we switched away from, until the new voice has spoken once
+    pending_switch_from: Optional[str] = None
+
     GPIO.setmode(GPIO.BOARD)
     GPIO.setup(BUTTON_PIN, GPIO.IN)
 
@@ -661,7 +924,22 @@ def main() -> None:
             with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_file:
                 record_audio_while_pressed(tmp_file.name)
 
-                user_text = transcribe_audio(tmp_file.name)
+                if LANGUAGE == "auto":
+                    language, langid_seconds = detect_language(tmp_file.name)
+                    langid_turns += 1
+                    langid_total_seconds += langid_seconds
+                    logger.info(
+                        f"[LANGID] Overhead this turn: {langid_seconds * 1000:.0f} ms "
+                        f"(avg {langid_total_seconds / langid_turns * 1000:.0f} ms over {langid_turns} turns)"
+                    )
+                    if language != current_language:
+                        if pending_switch_from is None:
+                            pending_switch_from = current_language
+                        elif pending_switch_from == language:
+                            pending_switch_from = None  # switched back before speaking
+                        current_language = language
+
+                user_text = transcribe_audio(tmp_file.name, current_language)
                 logger.info(f"User said: {user_text!r}")
 
                 if not user_text.strip():
@@ -671,13 +949,31 @@ def main() -> None:
                 current_emotion = emotion_manager.get_state()
                 logger.info(f"Current emotion state: {current_emotion}")
 
-                answer = ask_llm_with_emotion(user_text, current_emotion)
+                answer = ask_llm_with_emotion(user_text, current_emotion, language=current_language)
                 logger.info(f"Assistant answer: {answer!r}")
 
-                text_to_speech(answer)
+                voice = piper_voices.get(current_language)
+                # Steady-state figure taken before this synthesis is folded in
+                expected_per_char = voice.seconds_per_char() if voice is not None else None
+
+                synth_seconds = text_to_speech(answer, current_language)
+
+                if pending_switch_from is not None:
+                    log_switch_cost(
+                        pending_switch_from,
+                        current_language,
+                        answer,
+                        synth_seconds,
+                        expected_per_char,
+                        restart_seconds.get(current_language),
+                    )
+                    pending_switch_from = None
+
                 logger.info("Ready. You can speak again whenever you want.\n")
 
     finally:
+        close_piper_voices()
+        logger.info("Piper voices stopped.")
         GPIO.cleanup()
         logger.info("GPIO cleaned up. Exiting.")
 
@@ -0,0 +1,324 @@
+import os
+import json
+import time
+import threading
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger("assistant.llm_router")
+
+
+# ======================================
+# LLM ROUTER (MULTI-ENDPOINT, HEALTH-CHECKED)
+# ======================================
+
+def _slot_is_busy(slot: Any) -> bool:
+    """
+    Return True if a llama.cpp /slots entry is processing a request.
+    Newer servers expose 'is_processing', older ones 'state' (0 = idle).
+    """
+    if not isinstance(slot, dict):
+        return False
+    if "is_processing" in slot:
+        return bool(slot["is_processing"])
+    return slot.get("state", 0) != 0
+
+
+class LLMRouter:
+    """
+    Thread-safe router over several local llama.cpp servers.
+    A background worker polls /health and /slots; each completion goes
+    to the least-loaded healthy endpoint and fails over to the next one.
+    Each attempt is capped at attempt_timeout so a hung server leaves
+    time for the others, and the whole call is bounded by deadline.
+    An endpoint that fails or times out is demoted for failure_cooldown
+    seconds; a passing /health poll does not clear that.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[str],
+        completion_path: str = "/completion",
+        health_timeout: float = 1.0,
+        connect_timeout: float = 2.0,
+        attempt_timeout: float = 25.0,
+        deadline: float = 60.0,
+        failure_cooldown: float = 60.0,
+        stats_file: Optional[str] = None,
+        max_decisions: int = 50,
+    ) -> None:
+        self.completion_path = completion_path
+        self.health_timeout = health_timeout
+        self.connect_timeout = connect_timeout
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.failure_cooldown = failure_cooldown
+        self.stats_file = stats_file
+
+        # Separate sessions so health polls never wait on a completion's connection.
+        self._poll_session = requests.Session()
+        self._post_session = requests.Session()
+
+        self._lock = threading.Lock()
+        self._stats_dirty = True
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+        for url in endpoints:
+            base = url.rstrip("/")
+            self._endpoints[base] = {
+                "healthy": True,  # optimistic until the first poll
+                "slots_total": None,
+                "slots_busy": None,
+                "in_flight": 0,
+                "routed": 0,
+                "failures": 0,
+                "cooldown_until": 0.0,  # time.monotonic() before which the endpoint is demoted
+                "last_latency": None,
+                "latency_ewma": None,
+                "last_error": None,
+            }
+        self._decisions = deque(maxlen=max_decisions)
+
+    # ---------- health checks ----------
+
+    def health_worker(self, interval: float = 2.0) -> None:
+        """Poll every endpoint forever; export stats when something changed."""
+        while True:
+            self.poll_all()
+            self.export_stats(only_if_changed=True)
+            time.sleep(interval)
+
+    def poll_all(self) -> None:
+        """Refresh health and slot occupancy for every endpoint once."""
+        for base in list(self._endpoints):
+            self._poll_endpoint(base)
+
+    def _poll_endpoint(self, base: str) -> None:
+        """
+        Refresh health and slot occupancy for a single endpoint.
+        Only changes are logged, so an idle assistant doesn't grow the log.
+        """
+        healthy = False
+        error = None
+        slots_total = None
+        slots_busy = None
+
+        try:
+            response = self._poll_session.get(f"{base}/health", timeout=self.health_timeout)
+            healthy = response.status_code == 200
+            if not healthy:
+                error = f"/health status {response.status_code}"
+        except Exception as exc:
+            error = str(exc)
+
+        if healthy:
+            # /slots may be disabled on the server; routing then relies on in_flight only.
+            try:
+                response = self._poll_session.get(f"{base}/slots", timeout=self.health_timeout)
+                if response.status_code == 200:
+                    slots = response.json()
+                    if isinstance(slots, list):
+                        slots_total = len(slots)
+                        slots_busy = sum(1 for slot in slots if _slot_is_busy(slot))
+            except Exception:
+                pass
+
+        with self._lock:
+            state = self._endpoints[base]
+            was_healthy = state["healthy"]
+            had_slots = state["slots_total"] is not None
+            state["healthy"] = healthy
+            state["slots_total"] = slots_total
+            state["slots_busy"] = slots_busy
+            if error:
+                state["last_error"] = error
+            if healthy != was_healthy:
+                self._stats_dirty = True
+
+        if was_healthy and not healthy:
+            logger.warning(f"[LLM-ROUTER] {base} is DOWN: {error}")
+        elif healthy and not was_healthy:
+            logger.info(f"[LLM-ROUTER] {base} is back UP.")
+        if healthy and had_slots != (slots_total is not None):
+            logger.debug(
+                f"[LLM-ROUTER] {base} /slots "
+                f"{'available' if slots_total is not None else 'unavailable'}."
+            )
+
+    # ---------- routing ----------
+
+    @staticmethod
+    def _load_locked(state: Dict[str, Any]) -> float:
+        """
+        Fraction of busy slots. Endpoints that don't report slots (or report
+        none) count as having a single slot, so every endpoint uses the same
+        scale. Must be called under self._lock.
+        """
+        total = state["slots_total"] or 1
+        busy = max(state["slots_busy"] or 0, state["in_flight"])
+        return busy / total
+
+    def _rank_key_locked(self, base: str, now: float) -> Tuple[bool, bool, float, float]:
+        """
+        Sort key: available (healthy and not cooling down after a failure)
+        first, then endpoints with a free slot, then by load, then by observed
+        latency. Must be called under self._lock.
+        """
+        state = self._endpoints[base]
+        unavailable = not state["healthy"] or now < state["cooldown_until"]
+        load = self._load_locked(state)
+        return (unavailable, load >= 1.0, load, state["latency_ewma"] or 0.0)
+
+    def ranked_endpoints(self) -> List[str]:
+        """
+        Endpoints in the order post_completion() will try them.
+        Unavailable endpoints are kept at the end as a last resort.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return sorted(self._endpoints, key=lambda base: self._rank_key_locked(base, now))
+
+    def _record_decision(self, base: str, attempt: int) -> None:
+        with self._lock:
+            state = self._endpoints[base]
+            load = self._load_locked(state)
+            latency = state["latency_ewma"]
+            state["in_flight"] += 1
+            state["routed"] += 1
+            self._decisions.append({
+                "time": time.time(),
+                "endpoint": base,
+                "attempt": attempt,
+                "healthy": state["healthy"],
+                "load": load,
+            })
+            self._stats_dirty = True
+
+        latency_str = f"{latency:.2f}s" if latency is not None else "n/a"
+        logger.info(
+            f"[LLM-ROUTER] Routing to {base} (attempt={attempt}, load={load:.2f}, "
+            f"avg_latency={latency_str})"
+        )
+
+    def _record_result(self, base: str, latency: float, error: Optional[str]) -> None:
+        """
+        Fold the attempt's elapsed time into the latency average (failures
+        included, so a server that keeps timing out looks slow) and start or
+        clear the failure cooldown.
+        """
+        with self._lock:
+            state = self._endpoints[base]
+            state["in_flight"] = max(0, state["in_flight"] - 1)
+            state["last_latency"] = latency
+            if state["latency_ewma"] is None:
+                state["latency_ewma"] = latency
+            else:
+                state["latency_ewma"] = 0.8 * state["latency_ewma"] + 0.2 * latency
+            if error is None:
+                state["cooldown_until"] = 0.0
+            else:
+                state["failures"] += 1
+                state["last_error"] = error
+                state["cooldown_until"] = time.monotonic() + self.failure_cooldown
+            self._stats_dirty = True
+
+    def post_completion(self, payload: Dict[str, Any]) -> Optional[requests.Response]:
+        """
+        POST the payload to the best endpoint, failing over on connection
+        errors, timeouts or non-200 responses. Returns the first 200 response,
+        the last error response if every endpoint failed, or None.
+
+        Each attempt splits its budget between the connect and read timeouts,
+        so the call returns within deadline. (requests' read timeout applies
+        per socket read; llama.cpp sends a non-streamed completion in one go.)
+        """
+        deadline = time.monotonic() + self.deadline
+        last_response = None
+        ranked = self.ranked_endpoints()
+
+        for attempt, base in enumerate(ranked, start=1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.error(
+                    f"[LLM-ROUTER] Deadline of {self.deadline:.0f}s exceeded "
+                    f"before trying {base}."
+                )
+                break
+
+            # The last candidate may use whatever budget is left.
+            if attempt < len(ranked):
+                budget = min(self.attempt_timeout, remaining)
+            else:
+                budget = remaining
+            connect_timeout = min(self.connect_timeout, budget / 2)
+            read_timeout = budget - connect_timeout
+
+            self._record_decision(base, attempt)
+            start = time.monotonic()
+
+            try:
+                response = self._post_session.post(
+                    f"{base}{self.completion_path}",
+                    json=payload,
+                    headers={"Content-Type": "application/json"},
+                    timeout=(connect_timeout, read_timeout),
+                )
+            except Exception as exc:
+                elapsed = time.monotonic() - start
+                self._record_result(base, elapsed, str(exc))
+                logger.warning(
+                    f"[LLM-ROUTER] {base} failed after {elapsed:.2f}s: {exc}. Failing over."
+                )
+                continue
+
+            elapsed = time.monotonic() - start
+
+            if response.status_code == 200:
+                self._record_result(base, elapsed, None)
+                logger.info(f"[LLM-ROUTER] {base} answered in {elapsed:.2f}s")
+                return response
+
+            self._record_result(base, elapsed, f"status {response.status_code}")
+            logger.warning(
+                f"[LLM-ROUTER] {base} returned status {response.status_code} "
+                f"after {elapsed:.2f}s. Failing over."
+            )
+            last_response = response
+
+        return last_response
+
+    # ---------- stats export ----------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of per-endpoint state and recent routing decisions."""
+        with self._lock:
+            return {
+                "time": time.time(),
+                "endpoints": {base: dict(state) for base, state in self._endpoints.items()},
+                "decisions": list(self._decisions),
+            }
+
+    def export_stats(self, path: Optional[str] = None, only_if_changed: bool = False) -> None:
+        """
+        Write the stats snapshot as JSON (atomic replace). With
+        only_if_changed, skip the write unless a routing decision, a request
+        result or a health change happened since the last export.
+        """
+        path = path or self.stats_file
+        if not path:
+            return
+
+        with self._lock:
+            if only_if_changed and not self._stats_dirty:
+                return
+            self._stats_dirty = False
+
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as stats_file:
+                json.dump(self.get_stats(), stats_file, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as exc:
+            logger.debug(f"[LLM-ROUTER] Could not export stats to {path}: {exc}")
@@ -0,0 +1,181 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import subprocess
+import time
+import logging
+from typing import IO, Optional
+
+logger = logging.getLogger("assistant.piper_voice")
+
+
+# ======================================
+# RESIDENT PIPER VOICE
+# ======================================
+
+class PiperVoice:
+    """
+    Resident Piper process for one voice model. The model is loaded once;
+    each utterance is one line on stdin, and Piper prints the path of the
+    WAV file it wrote (in --output_dir mode) on stdout.
+
+    A reader thread forwards stdout lines to a queue so every synthesis
+    waits at most synth_timeout; a hung process is killed and restarted on
+    the next call. Steady-state synthesis time per character is tracked so
+    callers can tell a slow first synthesis (e.g. after a language switch)
+    from a long answer.
+    """
+
+    def __init__(
+        self,
+        language: str,
+        model_path: str,
+        piper_bin: str,
+        length_scale: str = "0.9",
+        synth_timeout: float = 30.0,
+    ) -> None:
+        self.language = language
+        self.model_path = model_path
+        self.piper_bin = piper_bin
+        self.length_scale = length_scale
+        self.synth_timeout = synth_timeout
+
+        self._output_dir = tempfile.mkdtemp(prefix=f"piper_{language}_")
+        self._process: Optional[subprocess.Popen] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._lock = threading.Lock()
+
+        self._synth_seconds = 0.0
+        self._synth_chars = 0
+
+    # ---------- process management ----------
+
+    @staticmethod
+    def _read_stdout(stdout: IO[str], lines: "queue.Queue[Optional[str]]") -> None:
+        """Forward Piper's stdout lines to the queue; None marks EOF."""
+        try:
+            for line in stdout:
+                lines.put(line.strip())
+        except Exception:
+            pass
+        lines.put(None)
+
+    def _start_locked(self) -> None:
+        """Spawn the Piper process and its reader. Must be called under self._lock."""
+        self._process = subprocess.Popen(
+            [
+                self.piper_bin,
+                "--model",
+                self.model_path,
+                "--length_scale",
+                self.length_scale,
+                "--output_dir",
+                self._output_dir,
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        # Fresh queue per process so late lines from a killed one are never read.
+        self._lines = queue.Queue()
+        threading.Thread(
+            target=self._read_stdout,
+            args=(self._process.stdout, self._lines),
+            daemon=True,
+            name=f"PiperReader-{self.language}",
+        ).start()
+
+    def _stop_locked(self) -> None:
+        """Terminate the Piper process if running. Must be called under self._lock."""
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        self._process = None
+
+    def close(self) -> None:
+        """Stop the Piper process and remove its output directory."""
+        with self._lock:
+            self._stop_locked()
+        shutil.rmtree(self._output_dir, ignore_errors=True)
+
+    # ---------- synthesis ----------
+
+    def load(self, calibration_text: str) -> Optional[float]:
+        """
+        Start Piper and synthesize a short warm-up line so the model is
+        actually resident, then synthesize calibration_text to seed the
+        steady-state time per character. Returns the warm-up (load) time in
+        seconds, or None if either step produced no WAV file.
+        """
+        start = time.monotonic()
+        wav_path = self._synthesize("ok", record=False)
+        if not wav_path:
+            return None
+        elapsed = time.monotonic() - start
+        os.remove(wav_path)
+
+        wav_path = self._synthesize(calibration_text, record=True)
+        if not wav_path:
+            return None
+        os.remove(wav_path)
+        return elapsed
+
+    def synthesize(self, text: str) -> Optional[str]:
+        """
+        Synthesize one utterance and return the WAV path, or None on error
+        or timeout. The process is (re)started if it is not running.
+        """
+        return self._synthesize(text, record=True)
+
+    def _synthesize(self, text: str, record: bool) -> Optional[str]:
+        line = " ".join(text.split())
+        if not line:
+            return None
+
+        with self._lock:
+            try:
+                if self._process is None or self._process.poll() is not None:
+                    logger.info(f"[TTS] Starting resident Piper voice '{self.language}'...")
+                    self._start_locked()
+
+                start = time.monotonic()
+                self._process.stdin.write(line + "\n")
+                self._process.stdin.flush()
+                wav_path = self._lines.get(timeout=self.synth_timeout)
+                elapsed = time.monotonic() - start
+            except queue.Empty:
+                logger.error(
+                    f"[TTS] Resident Piper voice '{self.language}' gave no output in "
+                    f"{self.synth_timeout:.0f}s; killing it."
+                )
+                self._stop_locked()
+                return None
+            except Exception as exc:
+                logger.error(f"[TTS] Resident Piper voice '{self.language}' failed: {exc}")
+                self._stop_locked()
+                return None
+
+            if not wav_path:
+                logger.error(f"[TTS] Resident Piper voice '{self.language}' exited unexpectedly.")
+                self._stop_locked()
+                return None
+
+            if record:
+                self._synth_seconds += elapsed
+                self._synth_chars += len(line)
+
+        return wav_path
+
+    def seconds_per_char(self) -> Optional[float]:
+        """Average synthesis time per character so far, or None before any synthesis."""
+        with self._lock:
+            if not self._synth_chars:
+                return None
+            return self._synth_seconds / self._synth_chars
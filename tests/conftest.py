@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Make the top-level modules (llm_router.py, ...) importable from tests/.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,297 @@
+import json
+import logging
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from llm_router import LLMRouter, _slot_is_busy
+
+
+# ======================================
+# STUB llama.cpp SERVERS
+# ======================================
+
+class StubServer:
+    """
+    Minimal llama.cpp look-alike on an ephemeral port:
+    GET /health, GET /slots and POST /completion.
+    """
+
+    def __init__(self, health=200, slots=None, post_status=200, hang=False):
+        self.health = health
+        self.slots = slots  # None -> /slots answers 404 (disabled)
+        self.post_status = post_status
+        self.hang = hang
+        self.release = threading.Event()
+        self.posts = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client gave up (timeout tests)
+
+            def do_GET(self):
+                if self.path == "/health":
+                    self._reply(stub.health, {"status": "ok" if stub.health == 200 else "loading"})
+                elif self.path == "/slots" and stub.slots is not None:
+                    self._reply(200, stub.slots)
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.posts += 1
+                if stub.hang:
+                    stub.release.wait(30)
+                self._reply(stub.post_status, {"content": f"answer from {stub.url}"})
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _slots(busy, total):
+    return [{"id": i, "is_processing": i < busy} for i in range(total)]
+
+
+def _refused_url():
+    """URL of a local port with nothing listening on it."""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"http://127.0.0.1:{port}"
+
+
+@pytest.fixture
+def stubs():
+    servers = []
+
+    def make(**kwargs):
+        server = StubServer(**kwargs)
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.close()
+
+
+# ======================================
+# TESTS
+# ======================================
+
+def test_slot_is_busy_handles_old_and_new_formats():
+    assert _slot_is_busy({"is_processing": True})
+    assert not _slot_is_busy({"is_processing": False})
+    assert _slot_is_busy({"state": 1})
+    assert not _slot_is_busy({"state": 0})
+    assert not _slot_is_busy("garbage")
+
+
+def test_ranking_prefers_free_slots_and_puts_unhealthy_last(stubs):
+    down = stubs(health=503)
+    busy = stubs(slots=_slots(2, 2))
+    free = stubs(slots=_slots(1, 2))
+
+    router = LLMRouter([down.url, busy.url, free.url])
+    router.poll_all()
+
+    assert router.ranked_endpoints() == [free.url, busy.url, down.url]
+    stats = router.get_stats()["endpoints"]
+    assert stats[down.url]["healthy"] is False
+    assert stats[busy.url]["slots_busy"] == 2
+    assert stats[free.url]["slots_total"] == 2
+
+
+def test_unknown_slots_share_the_same_load_scale(stubs):
+    no_slots = stubs(slots=None)
+    empty_slots = stubs(slots=[])
+    half_busy = stubs(slots=_slots(1, 2))
+
+    router = LLMRouter([no_slots.url, empty_slots.url, half_busy.url])
+    router.poll_all()
+
+    # Unknown slot counts are treated as a single slot: idle -> 0.0.
+    assert router.ranked_endpoints() == [no_slots.url, empty_slots.url, half_busy.url]
+
+    # One request in flight saturates a single-slot endpoint, so it ranks
+    # behind an endpoint that still has a free slot.
+    router._endpoints[no_slots.url]["in_flight"] = 1
+    router._endpoints[empty_slots.url]["in_flight"] = 1
+    assert router.ranked_endpoints()[0] == half_busy.url
+
+
+def test_failover_order_on_error_status_and_refused_port(stubs):
+    error = stubs(post_status=500)
+    refused = _refused_url()
+    healthy = stubs()
+
+    router = LLMRouter([error.url, refused, healthy.url], connect_timeout=1.0)
+    response = router.post_completion({"prompt": "hola"})
+
+    assert response is not None
+    assert response.status_code == 200
+    assert response.json()["content"] == f"answer from {healthy.url}"
+
+    stats = router.get_stats()
+    assert [d["endpoint"] for d in stats["decisions"]] == [error.url, refused, healthy.url]
+    assert [d["attempt"] for d in stats["decisions"]] == [1, 2, 3]
+    assert stats["endpoints"][error.url]["failures"] == 1
+    assert stats["endpoints"][error.url]["last_error"] == "status 500"
+    assert stats["endpoints"][refused]["failures"] == 1
+    assert stats["endpoints"][healthy.url]["failures"] == 0
+
+    # Failed endpoints are demoted until the next health poll.
+    assert router.ranked_endpoints()[0] == healthy.url
+
+
+def test_all_endpoints_failing_returns_last_error_response(stubs):
+    first = stubs(post_status=500)
+    second = stubs(post_status=503)
+
+    router = LLMRouter([first.url, second.url])
+    response = router.post_completion({"prompt": "hola"})
+
+    assert response is not None
+    assert response.status_code == 503
+
+
+def test_hung_endpoint_fails_over_within_deadline(stubs):
+    hung = stubs(hang=True)
+    healthy = stubs()
+
+    router = LLMRouter([hung.url, healthy.url], attempt_timeout=1.0, deadline=6.0)
+    start = time.monotonic()
+    response = router.post_completion({"prompt": "hola"})
+    elapsed = time.monotonic() - start
+
+    assert response is not None
+    assert response.status_code == 200
+    assert response.json()["content"] == f"answer from {healthy.url}"
+    assert elapsed < 3.0
+    assert hung.posts == 1
+
+
+def test_deadline_bounds_total_time_when_every_endpoint_hangs(stubs):
+    hung = [stubs(hang=True) for _ in range(3)]
+
+    router = LLMRouter([s.url for s in hung], attempt_timeout=1.0, deadline=2.5)
+    start = time.monotonic()
+    response = router.post_completion({"prompt": "hola"})
+    elapsed = time.monotonic() - start
+
+    assert response is None
+    assert elapsed < 2.5 + 0.2
+    assert sum(s.posts for s in hung) == 3
+
+
+def test_timed_out_endpoint_stays_demoted_after_health_poll(stubs):
+    hung = stubs(hang=True)
+    healthy = stubs()
+
+    router = LLMRouter([hung.url, healthy.url], attempt_timeout=0.5, failure_cooldown=30.0)
+
+    for _ in range(3):
+        router.poll_all()  # /health keeps answering 200 on the hung server
+        response = router.post_completion({"prompt": "hola"})
+        assert response.status_code == 200
+
+    decisions = router.get_stats()["decisions"]
+    assert decisions[0]["endpoint"] == hung.url
+    assert [d["endpoint"] for d in decisions[1:]] == [healthy.url] * 3
+    assert hung.posts == 1
+    assert router.ranked_endpoints() == [healthy.url, hung.url]
+
+    stats = router.get_stats()["endpoints"][hung.url]
+    assert stats["failures"] == 1
+    assert stats["latency_ewma"] >= 0.2  # the timed-out attempt counts as slow
+
+
+def test_successful_request_clears_cooldown(stubs):
+    flaky = stubs(post_status=500)
+    router = LLMRouter([flaky.url], failure_cooldown=30.0)
+
+    assert router.post_completion({"prompt": "hola"}).status_code == 500
+    flaky.post_status = 200
+    assert router.post_completion({"prompt": "hola"}).status_code == 200
+    assert router.get_stats()["endpoints"][flaky.url]["cooldown_until"] == 0.0
+
+
+def test_unchanged_polls_do_not_log(stubs, caplog):
+    server = stubs(slots=None)
+    router = LLMRouter([server.url])
+    router.poll_all()
+
+    with caplog.at_level(logging.DEBUG):
+        router.poll_all()
+        router.poll_all()
+
+    assert [r for r in caplog.records if r.name == "assistant.llm_router"] == []
+
+
+def test_export_stats_records_latency_and_decisions(stubs, tmp_path):
+    healthy = stubs(slots=_slots(0, 1))
+    stats_path = tmp_path / "llm_router_stats.json"
+
+    router = LLMRouter([healthy.url], stats_file=str(stats_path))
+    router.poll_all()
+    assert router.post_completion({"prompt": "hola"}).status_code == 200
+    router.export_stats()
+
+    exported = json.loads(stats_path.read_text(encoding="utf-8"))
+    endpoint = exported["endpoints"][healthy.url]
+    assert endpoint["routed"] == 1
+    assert endpoint["in_flight"] == 0
+    assert endpoint["last_latency"] is not None
+    assert endpoint["latency_ewma"] == endpoint["last_latency"]
+    assert len(exported["decisions"]) == 1
+    assert exported["decisions"][0]["endpoint"] == healthy.url
+    assert exported["decisions"][0]["load"] == 0.0
+    assert not (tmp_path / "llm_router_stats.json.tmp").exists()
+
+
+def test_export_stats_only_if_changed_skips_idle_rounds(stubs, tmp_path):
+    healthy = stubs()
+    stats_path = tmp_path / "llm_router_stats.json"
+
+    router = LLMRouter([healthy.url], stats_file=str(stats_path))
+    router.poll_all()
+    router.export_stats(only_if_changed=True)
+    assert stats_path.exists()
+
+    stats_path.unlink()
+    router.poll_all()  # still healthy: nothing changed
+    router.export_stats(only_if_changed=True)
+    assert not stats_path.exists()
+
+    router.post_completion({"prompt": "hola"})
+    router.export_stats(only_if_changed=True)
+    assert stats_path.exists()
+
+
+def test_export_stats_without_path_is_a_no_op(stubs, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    router = LLMRouter([stubs().url])
+    router.export_stats()
+    assert list(tmp_path.iterdir()) == []
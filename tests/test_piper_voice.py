@@ -0,0 +1,127 @@
+import os
+import stat
+import sys
+import textwrap
+import time
+
+import pytest
+
+from piper_voice import PiperVoice
+
+
+# ======================================
+# FAKE PIPER BINARY
+# ======================================
+
+FAKE_PIPER = textwrap.dedent(
+    """\
+    import os, sys, time
+
+    args = sys.argv[1:]
+    model = args[args.index("--model") + 1]
+    out_dir = args[args.index("--output_dir") + 1]
+    if model == "missing.onnx":
+        sys.exit(1)
+
+    for count, line in enumerate(sys.stdin):
+        text = line.strip()
+        if text == "HANG":
+            time.sleep(60)
+        if text == "CRASH":
+            sys.exit(1)
+        path = os.path.join(out_dir, f"{count}.wav")
+        with open(path, "w") as wav:
+            wav.write(text)
+        print(path, flush=True)
+    """
+)
+
+
+@pytest.fixture
+def piper_bin(tmp_path):
+    script = tmp_path / "fake_piper.py"
+    script.write_text(FAKE_PIPER)
+    wrapper = tmp_path / "piper"
+    wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n')
+    wrapper.chmod(wrapper.stat().st_mode | stat.S_IEXEC)
+    return str(wrapper)
+
+
+@pytest.fixture
+def voices():
+    created = []
+    yield created
+    for voice in created:
+        voice.close()
+
+
+def _voice(voices, piper_bin, model="es.onnx", **kwargs):
+    voice = PiperVoice("es", model, piper_bin, **kwargs)
+    voices.append(voice)
+    return voice
+
+
+# ======================================
+# TESTS
+# ======================================
+
+def test_load_warms_up_and_seeds_seconds_per_char(voices, piper_bin):
+    voice = _voice(voices, piper_bin)
+    assert voice.seconds_per_char() is None
+
+    elapsed = voice.load("Hola, soy tu asistente.")
+
+    assert elapsed is not None
+    assert voice.seconds_per_char() is not None
+    assert os.listdir(voice._output_dir) == []  # warm-up files removed
+
+
+def test_load_fails_when_piper_cannot_start(voices, piper_bin, tmp_path):
+    missing_bin = _voice(voices, str(tmp_path / "no_such_piper"))
+    assert missing_bin.load("hola") is None
+
+    bad_model = _voice(voices, piper_bin, model="missing.onnx")
+    assert bad_model.load("hola") is None
+
+
+def test_synthesize_writes_one_line_per_utterance(voices, piper_bin):
+    voice = _voice(voices, piper_bin)
+
+    wav_path = voice.synthesize("hola\nmundo  ")
+
+    with open(wav_path) as wav:
+        assert wav.read() == "hola mundo"
+    assert voice.synthesize("   ") is None
+
+
+def test_hung_process_times_out_and_restarts(voices, piper_bin):
+    voice = _voice(voices, piper_bin, synth_timeout=0.5)
+    assert voice.synthesize("hola") is not None
+    hung_process = voice._process
+
+    start = time.monotonic()
+    assert voice.synthesize("HANG") is None
+    assert time.monotonic() - start < 2.0
+    assert hung_process.poll() is not None  # killed
+
+    wav_path = voice.synthesize("otra vez")
+    assert wav_path is not None
+    assert voice._process is not hung_process
+
+
+def test_crashed_process_is_restarted(voices, piper_bin):
+    voice = _voice(voices, piper_bin)
+    assert voice.synthesize("CRASH") is None
+    assert voice.synthesize("hola") is not None
+
+
+def test_close_stops_process_and_removes_output_dir(voices, piper_bin):
+    voice = _voice(voices, piper_bin)
+    assert voice.synthesize("hola") is not None
+    process = voice._process
+    output_dir = voice._output_dir
+
+    voice.close()
+
+    assert process.poll() is not None
+    assert not os.path.exists(output_dir)